@@ -0,0 +1,70 @@
+"""
+Cache Helper Functions
+
+Redis-backed cache-aside helpers for hot read paths. Caching is optional:
+when REDIS_URL is not set (or Redis is unreachable) every lookup is a miss
+and callers fall back to MongoDB.
+
+Menu snapshots live for MENU_ITEM_TTL seconds. There is no menu update
+endpoint yet, so a price or GST change made directly in MongoDB is served
+stale to create_order for up to that long; any update/delete path added for
+menu items must call invalidate_menu_item() after writing.
+"""
+
+import json
+import os
+from typing import Dict, Iterable
+
+from bson import ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+
+cache = None
+
+redis_url = os.getenv("REDIS_URL")
+
+if redis_url:
+    import redis.asyncio as redis
+    # short timeouts so an unreachable Redis degrades to misses instead of stalling requests
+    cache = redis.from_url(redis_url, socket_timeout=0.25, socket_connect_timeout=0.25)
+
+MENU_ITEM_TTL = 900
+MENU_ITEM_FIELDS = ("name", "price", "gst_rate")
+
+def menu_item_key(oid: ObjectId) -> str:
+    return f"v1:menuitem:{oid}"
+
+async def get_menu_items(ids: Iterable[ObjectId]) -> Dict[ObjectId, dict]:
+    """Return cached menu snapshots keyed by ObjectId; misses are omitted"""
+    ids = list(ids)
+    if cache is None or not ids:
+        return {}
+    try:
+        values = await cache.mget([menu_item_key(oid) for oid in ids])
+    except Exception:
+        return {}
+    return {oid: json.loads(v) for oid, v in zip(ids, values) if v is not None}
+
+async def set_menu_items(items: Dict[ObjectId, dict]):
+    """Store compact menu snapshots (name, price, gst_rate)"""
+    if cache is None or not items:
+        return
+    try:
+        pipe = cache.pipeline(transaction=False)
+        for oid, mi in items.items():
+            # omit absent fields so readers' .get() defaults still apply
+            snapshot = {f: mi[f] for f in MENU_ITEM_FIELDS if f in mi}
+            pipe.set(menu_item_key(oid), json.dumps(snapshot), ex=MENU_ITEM_TTL)
+        await pipe.execute()
+    except Exception:
+        pass
+
+async def invalidate_menu_item(oid: ObjectId):
+    """Drop a cached menu snapshot; call whenever a menu item changes"""
+    if cache is None:
+        return
+    try:
+        await cache.delete(menu_item_key(oid))
+    except Exception:
+        pass
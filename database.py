@@ -5,11 +5,13 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
@@ -22,11 +24,20 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # Keep warm connections open so the first requests after a restart
+    # don't pay the TCP/TLS handshake
+    _client = AsyncIOMotorClient(
+        database_url,
+        minPoolSize=int(os.getenv("DATABASE_MIN_POOL_SIZE", 10)),
+        maxPoolSize=int(os.getenv("DATABASE_MAX_POOL_SIZE", 100)),
+        maxIdleTimeMS=60000,
+        serverSelectionTimeoutMS=3000,
+        retryWrites=True,
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -37,19 +48,49 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    # callers may stamp created_at themselves when they need the exact value
+    data_dict.setdefault('created_at', datetime.now(timezone.utc))
+    data_dict['updated_at'] = data_dict['created_at']
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def create_documents(collection_name: str, items: List[Union[BaseModel, dict]]):
+    """Insert many documents with timestamps in a single unordered batch.
+
+    Returns (ids, errors): ids is aligned with items, holding None for any
+    document that failed; errors maps those positions to the server message.
+    """
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict.setdefault('_id', ObjectId())
+        data_dict.setdefault('created_at', now)
+        data_dict['updated_at'] = data_dict['created_at']
+        docs.append(data_dict)
+
+    errors = {}
+    try:
+        await db[collection_name].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # unordered: everything not listed in writeErrors was written
+        errors = {err["index"]: err.get("errmsg") for err in e.details.get("writeErrors", [])}
+    ids = [None if i in errors else str(d['_id']) for i, d in enumerate(docs)]
+    return ids, errors
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
+    # The C extension decodes BSON straight into dicts. RawBSONDocument would only
+    # defer that work, since responses are re-encoded as JSON with string ids.
     cursor = db[collection_name].find(filter_dict or {})
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=None)
@@ -1,14 +1,26 @@
+import asyncio
+import logging
 import os
-from fastapi import FastAPI, HTTPException
+import time
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
 
-from database import db, create_document, get_documents
-from schemas import MenuItem, InventoryItem, Customer, Order, OrderItem, Payment, ReportFilter
+from database import db, create_document, create_documents, get_documents
+from cache import MENU_ITEM_FIELDS, get_menu_items, set_menu_items
+from totals import order_totals, warm_up
+from responses import MongoJSONResponse
+from rollup import REPORT_TIMEZONE, REPORT_TZ, read_rollup, reconcile_forever, record_orders, record_status_change
+from schemas import MenuItem, InventoryItem, Customer, Order, OrderItem, OrderStatus, Payment, ReportFilter
 
-app = FastAPI(title="Bill Printing App API")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Bill Printing App API", default_response_class=MongoJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,23 +29,84 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# list responses repeat the same keys on every row and compress well
+app.add_middleware(GZipMiddleware, minimum_size=512)
+
+@app.on_event("startup")
+async def on_startup():
+    # JIT the large-order totals kernel before serving so it never compiles mid-request
+    warm_up()
+    if db is None:
+        return
+    # establish pool connections before serving traffic; if Mongo is down, start
+    # anyway so /test can report it
+    try:
+        await db.command("ping")
+    except PyMongoError as e:
+        logger.warning("Database ping failed at startup: %s", e)
+    # indexes are retried until Mongo is reachable; the rollup is built on first
+    # run and then kept reconciled
+    app.state.setup_task = asyncio.create_task(setup_database())
+    app.state.rollup_task = asyncio.create_task(reconcile_forever())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for name in ("setup_task", "rollup_task"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+
+SETUP_RETRY_INTERVAL = 30
+
+async def ensure_indexes():
+    await db["order"].create_index([("status", 1), ("_id", -1)])
+    await db["order"].create_index("customer_id")
+    await db["menuitem"].create_index("category")
+    try:
+        await db["inventoryitem"].create_index("sku", unique=True)
+    except OperationFailure as e:
+        # existing data may hold duplicate SKUs; serve anyway until they are cleaned up
+        logger.warning("Could not create unique index on inventoryitem.sku: %s", e)
+
+async def setup_database():
+    """Create indexes and prime the /test cache, retrying until both succeed"""
+    while True:
+        try:
+            await ensure_indexes()
+            await refresh_collections()
+            return
+        except PyMongoError as e:
+            logger.warning("Database setup failed, retrying in %ss: %s", SETUP_RETRY_INTERVAL, e)
+            await asyncio.sleep(SETUP_RETRY_INTERVAL)
+
+# Collection names are cached so health checks on /test don't hit the database
+
+COLLECTIONS_TTL = 60
+
+async def refresh_collections():
+    app.state.db_name = db.name
+    app.state.collections = await db.list_collection_names()
+    app.state.collections_fetched_at = time.monotonic()
 
 # Utility
 
 def to_oid(id_str: str):
-    try:
-        return ObjectId(id_str)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid id")
+    # 24 hex chars -> 12 raw bytes; ObjectId takes bytes without running its string validation
+    if len(id_str) == 24:
+        try:
+            return ObjectId(bytes.fromhex(id_str))
+        except Exception:
+            pass
+    raise HTTPException(status_code=400, detail="Invalid id")
 
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Bill Printing App API"}
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -46,9 +119,12 @@ def test_database():
         if db is not None:
             response["database"] = "✅ Connected & Working"
             response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-            response["database_name"] = db.name
+            fetched_at = getattr(app.state, "collections_fetched_at", None)
+            if fetched_at is None or time.monotonic() - fetched_at > COLLECTIONS_TTL:
+                await refresh_collections()
+            response["database_name"] = app.state.db_name
             response["connection_status"] = "Connected"
-            response["collections"] = db.list_collection_names()
+            response["collections"] = app.state.collections
         else:
             response["database"] = "⚠️ Available but not initialized"
     except Exception as e:
@@ -57,42 +133,39 @@ def test_database():
 
 # ----- Menu Management -----
 @app.post("/menu", response_model=dict)
-def create_menu_item(item: MenuItem):
-    inserted_id = create_document("menuitem", item)
+async def create_menu_item(item: MenuItem):
+    inserted_id = await create_document("menuitem", item)
     return {"id": inserted_id}
 
-@app.get("/menu", response_model=List[dict])
-def list_menu_items():
-    items = get_documents("menuitem")
-    for it in items:
-        it["_id"] = str(it.get("_id"))
-    return items
+@app.get("/menu")
+async def list_menu_items():
+    items = await get_documents("menuitem")
+    return MongoJSONResponse(items)
 
 # ----- Inventory Management -----
 @app.post("/inventory", response_model=dict)
-def create_inventory_item(item: InventoryItem):
-    inserted_id = create_document("inventoryitem", item)
+async def create_inventory_item(item: InventoryItem):
+    try:
+        inserted_id = await create_document("inventoryitem", item)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="SKU already exists")
     return {"id": inserted_id}
 
-@app.get("/inventory", response_model=List[dict])
-def list_inventory_items():
-    items = get_documents("inventoryitem")
-    for it in items:
-        it["_id"] = str(it.get("_id"))
-    return items
+@app.get("/inventory")
+async def list_inventory_items():
+    items = await get_documents("inventoryitem")
+    return MongoJSONResponse(items)
 
 # ----- Customer Management -----
 @app.post("/customers", response_model=dict)
-def create_customer(customer: Customer):
-    inserted_id = create_document("customer", customer)
+async def create_customer(customer: Customer):
+    inserted_id = await create_document("customer", customer)
     return {"id": inserted_id}
 
-@app.get("/customers", response_model=List[dict])
-def list_customers():
-    items = get_documents("customer")
-    for it in items:
-        it["_id"] = str(it.get("_id"))
-    return items
+@app.get("/customers")
+async def list_customers():
+    items = await get_documents("customer")
+    return MongoJSONResponse(items)
 
 # ----- Order Management -----
 
@@ -103,25 +176,40 @@ class OrderCreate(BaseModel):
     discount: float = 0
     notes: Optional[str] = None
 
-@app.post("/orders", response_model=dict)
-def create_order(payload: OrderCreate):
-    # expand items from menu snapshot
-    subtotal = 0
-    tax_total = 0
+async def fetch_menu_items(ids) -> dict:
+    """Resolve menu items by ObjectId from cache, then the misses in a single round-trip"""
+    ids = list(set(ids))
+    menu_by_id = await get_menu_items(ids)
+    missing = [oid for oid in ids if oid not in menu_by_id]
+    if missing:
+        fetched = {
+            m["_id"]: m
+            async for m in db["menuitem"].find({"_id": {"$in": missing}}, {f: 1 for f in MENU_ITEM_FIELDS})
+        }
+        menu_by_id.update(fetched)
+        await set_menu_items(fetched)
+    return menu_by_id
+
+def build_order(payload: OrderCreate, ids: List[ObjectId], menu_by_id: dict) -> Order:
+    # expand items from menu snapshot; the snapshot is the source of truth for
+    # receipts, so bills never re-join menuitem. Totals are computed here rather
+    # than in a pipeline update because update pipelines cannot run $lookup.
     expanded_items: List[OrderItem] = []
+    # totals inputs, collected in the same pass as the snapshots
+    prices: List[float] = []
+    qtys: List[float] = []
+    rates: List[float] = []
 
-    for oi in payload.items:
-        # fetch menu item details
-        mi = db["menuitem"].find_one({"_id": to_oid(oi.menu_item_id)})
+    for oid, oi in zip(ids, payload.items):
+        mi = menu_by_id.get(oid)
         if not mi:
             raise HTTPException(status_code=404, detail="Menu item not found")
         unit_price = float(mi.get("price", 0))
-        line_subtotal = unit_price * oi.quantity
         gst_rate = float(mi.get("gst_rate", 0))
-        line_tax = line_subtotal * gst_rate
-        subtotal += line_subtotal
-        tax_total += line_tax
-        expanded_items.append(OrderItem(
+        prices.append(unit_price)
+        qtys.append(oi.quantity)
+        rates.append(gst_rate)
+        expanded_items.append(OrderItem.model_construct(
             menu_item_id=oi.menu_item_id,
             name=mi.get("name"),
             price=unit_price,
@@ -130,13 +218,12 @@ def create_order(payload: OrderCreate):
             gst_rate=gst_rate,
         ))
 
-    subtotal_after_discount = max(0.0, subtotal - float(payload.discount))
-    # Recompute tax on discounted subtotal proportionally
-    tax_ratio = 0.0 if subtotal == 0 else tax_total / subtotal
-    tax_total_discounted = subtotal_after_discount * tax_ratio
-    grand_total = subtotal_after_discount + tax_total_discounted
+    subtotal_after_discount, tax_total_discounted, grand_total = order_totals(
+        prices, qtys, rates, float(payload.discount)
+    )
 
-    order_doc = Order(
+    # every field is server-computed from validated input, so skip re-validation
+    return Order.model_construct(
         table_no=payload.table_no,
         customer_id=payload.customer_id,
         items=expanded_items,
@@ -149,29 +236,97 @@ def create_order(payload: OrderCreate):
         notes=payload.notes,
     )
 
-    inserted_id = create_document("order", order_doc)
+@app.post("/orders", response_model=dict)
+async def create_order(payload: OrderCreate):
+    ids = [to_oid(oi.menu_item_id) for oi in payload.items]
+    menu_by_id = await fetch_menu_items(ids)
+    order_doc = build_order(payload, ids, menu_by_id)
+
+    # stamp created_at once so the rollup buckets on the stored value
+    doc = order_doc.model_dump()
+    doc["created_at"] = datetime.now(timezone.utc)
+    inserted_id = await create_document("order", doc)
+    await record_orders([doc])
     return {"id": inserted_id, "totals": {
         "subtotal": order_doc.subtotal,
         "tax_total": order_doc.tax_total,
         "grand_total": order_doc.grand_total
     }}
 
-@app.get("/orders", response_model=List[dict])
-def list_orders(status: Optional[str] = None):
+MAX_BULK_ORDERS = 500
+
+@app.post("/orders/bulk", response_model=dict)
+async def create_orders_bulk(payload: List[OrderCreate]):
+    if len(payload) > MAX_BULK_ORDERS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BULK_ORDERS} orders per batch")
+    # orders that fail validation or insertion are reported by index; the rest are written
+    failed = {}
+    ids_per_order = []
+    for i, order in enumerate(payload):
+        ids = []
+        for j, oi in enumerate(order.items):
+            try:
+                ids.append(to_oid(oi.menu_item_id))
+            except HTTPException as e:
+                failed[i] = {"index": i, "line": j, "detail": e.detail}
+                break
+        ids_per_order.append(ids)
+
+    # one menu lookup across every order, then a single insert_many
+    menu_by_id = await fetch_menu_items(
+        oid for i, ids in enumerate(ids_per_order) if i not in failed for oid in ids
+    )
+    for i, ids in enumerate(ids_per_order):
+        if i in failed:
+            continue
+        for j, oid in enumerate(ids):
+            if oid not in menu_by_id:
+                failed[i] = {"index": i, "line": j, "detail": "Menu item not found"}
+                break
+
+    valid = [i for i in range(len(payload)) if i not in failed]
+    now = datetime.now(timezone.utc)
+    order_docs = [
+        {**build_order(payload[i], ids_per_order[i], menu_by_id).model_dump(), "created_at": now}
+        for i in valid
+    ]
+
+    inserted_ids, errors = await create_documents("order", order_docs) if order_docs else ([], {})
+    await record_orders([doc for doc, oid in zip(order_docs, inserted_ids) if oid is not None])
+
+    # ids line up with the request; failed orders are null and listed with their error
+    ids = [None] * len(payload)
+    for pos, i in enumerate(valid):
+        ids[i] = inserted_ids[pos]
+        if pos in errors:
+            failed[i] = {"index": i, "detail": errors[pos]}
+    return {"ids": ids, "failed": [failed[i] for i in sorted(failed)]}
+
+@app.get("/orders")
+async def list_orders(status: Optional[str] = None, after: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
     filt = {"status": status} if status else {}
-    orders = get_documents("order", filt, limit=None)
-    for o in orders:
-        o["_id"] = str(o.get("_id"))
-    return orders
+    # keyset pagination, newest first: the cursor is the last _id of the previous page
+    if after:
+        filt["_id"] = {"$lt": to_oid(after)}
+    # list view does not need the embedded line items
+    cursor = db["order"].find(filt, {"items": 0}).sort("_id", -1).limit(limit)
+    orders = await cursor.to_list(length=limit)
+    next_cursor = str(orders[-1]["_id"]) if len(orders) == limit else None
+    return MongoJSONResponse({"items": orders, "next_cursor": next_cursor})
 
 class OrderStatusUpdate(BaseModel):
-    status: str
+    status: OrderStatus
 
 @app.patch("/orders/{order_id}/status")
-def update_order_status(order_id: str, payload: OrderStatusUpdate):
-    res = db["order"].update_one({"_id": to_oid(order_id)}, {"$set": {"status": payload.status}})
-    if res.matched_count == 0:
+async def update_order_status(order_id: str, payload: OrderStatusUpdate):
+    before = await db["order"].find_one_and_update(
+        {"_id": to_oid(order_id)},
+        {"$set": {"status": payload.status}, "$currentDate": {"updated_at": True}},
+        projection={"status": 1, "grand_total": 1, "created_at": 1},
+    )
+    if before is None:
         raise HTTPException(status_code=404, detail="Order not found")
+    await record_status_change(before, payload.status)
     return {"ok": True}
 
 class PaymentIn(BaseModel):
@@ -180,34 +335,49 @@ class PaymentIn(BaseModel):
     reference: Optional[str] = None
 
 @app.post("/orders/{order_id}/pay")
-def add_payment(order_id: str, payment: PaymentIn):
-    res = db["order"].update_one(
+async def add_payment(order_id: str, payment: PaymentIn):
+    entry = {"method": payment.method, "amount": payment.amount}
+    if payment.reference is not None:
+        entry["reference"] = payment.reference
+    res = await db["order"].update_one(
         {"_id": to_oid(order_id)},
-        {"$push": {"payments": payment.model_dump()}, "$set": {"updated_at": None}}
+        {"$push": {"payments": entry}, "$currentDate": {"updated_at": True}}
     )
     if res.matched_count == 0:
         raise HTTPException(status_code=404, detail="Order not found")
     return {"ok": True}
 
 # ----- Reports -----
+
+def parse_report_day(value: str):
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(REPORT_TZ)
+    # the rollup is per day, so refuse bounds that would silently be truncated
+    if dt.hour or dt.minute or dt.second or dt.microsecond:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Report ranges are whole days in {REPORT_TIMEZONE}; pass dates like 2026-10-14",
+        )
+    return dt.date()
+
 @app.post("/reports/sales")
-def sales_report(filters: ReportFilter):
-    pipeline = []
-    # Future: add date filters when created_at exists by default in helper.
-    pipeline.append({"$group": {"_id": None, "revenue": {"$sum": "$grand_total"}, "orders": {"$sum": 1}}})
-    data = list(db["order"].aggregate(pipeline))
-    if not data:
-        return {"revenue": 0, "orders": 0}
-    return {"revenue": round(float(data[0]["revenue"]), 2), "orders": int(data[0]["orders"]) }
+async def sales_report(filters: ReportFilter):
+    # totals are read from the per-day rollup; both bounds are inclusive local days
+    day_from = parse_report_day(filters.date_from) if filters.date_from else None
+    day_to = parse_report_day(filters.date_to) if filters.date_to else None
+    return await read_rollup(day_from, day_to)
 
 # ----- Bill Print (data) -----
 @app.get("/orders/{order_id}/bill")
-def get_order_bill(order_id: str):
-    o = db["order"].find_one({"_id": to_oid(order_id)})
+async def get_order_bill(order_id: str):
+    o = await db["order"].find_one({"_id": to_oid(order_id)})
     if not o:
         raise HTTPException(status_code=404, detail="Order not found")
-    o["_id"] = str(o["_id"])
-    return o
+    return MongoJSONResponse(o)
 
 if __name__ == "__main__":
     import uvicorn
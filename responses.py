@@ -0,0 +1,24 @@
+"""
+Response Classes
+
+ORJSON response that understands MongoDB types, so handlers can return
+documents straight from the driver without stringifying _id themselves.
+"""
+
+from typing import Any
+
+import orjson
+from bson import Decimal128, ObjectId
+from fastapi.responses import ORJSONResponse
+
+def mongo_default(o: Any):
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, Decimal128):
+        return str(o.to_decimal())
+    raise TypeError
+
+class MongoJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        # PyMongo returns naive datetimes in UTC
+        return orjson.dumps(content, default=mongo_default, option=orjson.OPT_NAIVE_UTC)
@@ -0,0 +1,205 @@
+"""
+Sales Rollup
+
+Per-day order totals kept in the order_rollup collection, so /reports/sales
+reads one small document per day instead of aggregating every order.
+Totals are incremented as orders are created and moved between statuses
+as orders change status. Those increments are best-effort; a periodic
+reconcile recomputes every day that has orders written since its last run,
+so a failed increment only skews reports until the next pass. Only the
+worker holding a lease in rollup_state runs the reconcile.
+
+Days are calendar days in REPORT_TIMEZONE (default Asia/Kolkata). Each
+rollup document's `day` is the UTC instant of that local midnight.
+
+Requires MongoDB 4.2+ ($merge).
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+
+from pymongo.errors import DuplicateKeyError
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "order_rollup"
+STATE_COLLECTION = "rollup_state"
+RECONCILE_INTERVAL = 300
+# one worker reconciles per interval; the lease outlives a pass so the holder
+# renews it, and another worker takes over if the holder stops renewing
+LEASE_ID = "order_rollup_lease"
+LEASE_TTL = timedelta(seconds=RECONCILE_INTERVAL * 2)
+WORKER_ID = uuid.uuid4().hex
+# updated_at may come from the server clock ($currentDate); look back a little
+RECONCILE_OVERLAP = timedelta(seconds=60)
+
+REPORT_TIMEZONE = os.getenv("REPORT_TIMEZONE", "Asia/Kolkata")
+REPORT_TZ = ZoneInfo(REPORT_TIMEZONE)
+
+def _local(part: str) -> dict:
+    return {part: {"date": "$created_at", "timezone": REPORT_TIMEZONE}}
+
+# local midnight of created_at, as a UTC instant
+DAY_EXPR = {"$dateFromParts": {
+    "year": _local("$year"),
+    "month": _local("$month"),
+    "day": _local("$dayOfMonth"),
+    "timezone": REPORT_TIMEZONE,
+}}
+
+def local_day(dt: datetime) -> date:
+    """Calendar day of a timestamp in REPORT_TIMEZONE (naive values are UTC, as stored by PyMongo)"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(REPORT_TZ).date()
+
+def day_key(d: date) -> datetime:
+    """Rollup key for a local calendar day: its midnight in REPORT_TIMEZONE, as naive UTC"""
+    midnight = datetime(d.year, d.month, d.day, tzinfo=REPORT_TZ)
+    return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+async def record_orders(orders: List[dict]):
+    """Add newly inserted orders to the rollup of the day they were created"""
+    per_day = defaultdict(lambda: defaultdict(int))
+    for o in orders:
+        inc = per_day[day_key(local_day(o["created_at"]))]
+        inc["revenue"] += o["grand_total"]
+        inc["orders"] += 1
+        inc[f"by_status.{o['status']}.revenue"] += o["grand_total"]
+        inc[f"by_status.{o['status']}.orders"] += 1
+    try:
+        for day, inc in per_day.items():
+            await db[ROLLUP_COLLECTION].update_one({"day": day}, {"$inc": dict(inc)}, upsert=True)
+    except Exception:
+        logger.exception("Failed to update order rollup; the next reconcile will correct it")
+
+async def record_status_change(before: dict, status: str):
+    """Move an order's totals from its previous status to the new one"""
+    old = before.get("status")
+    if old == status or before.get("created_at") is None:
+        return
+    grand_total = float(before.get("grand_total", 0))
+    try:
+        await db[ROLLUP_COLLECTION].update_one(
+            {"day": day_key(local_day(before["created_at"]))},
+            {"$inc": {
+                f"by_status.{old}.revenue": -grand_total,
+                f"by_status.{old}.orders": -1,
+                f"by_status.{status}.revenue": grand_total,
+                f"by_status.{status}.orders": 1,
+            }},
+            upsert=True,
+        )
+    except Exception:
+        logger.exception("Failed to update order rollup; the next reconcile will correct it")
+
+async def rebuild_rollup(match: Optional[dict] = None):
+    """Recompute the rollup of every day with orders matching `match`"""
+    pipeline = [
+        {"$match": match or {}},
+        {"$group": {
+            "_id": {"day": DAY_EXPR, "status": "$status"},
+            "revenue": {"$sum": "$grand_total"},
+            "orders": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": "$_id.day",
+            "revenue": {"$sum": "$revenue"},
+            "orders": {"$sum": "$orders"},
+            "by_status": {"$push": {"k": "$_id.status", "v": {"revenue": "$revenue", "orders": "$orders"}}},
+        }},
+        {"$match": {"_id": {"$ne": None}}},
+        {"$project": {"_id": 0, "day": "$_id", "revenue": 1, "orders": 1, "by_status": {"$arrayToObject": "$by_status"}}},
+        {"$merge": {"into": ROLLUP_COLLECTION, "on": "day", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    await db["order"].aggregate(pipeline).to_list(length=None)
+
+async def reconcile_rollup():
+    """Recompute the days of orders written or updated since the last run"""
+    started = datetime.now(timezone.utc)
+    state = await db[STATE_COLLECTION].find_one({"_id": ROLLUP_COLLECTION})
+    if state is None or state.get("timezone") != REPORT_TIMEZONE:
+        # first run, or days were bucketed in another zone: start over
+        await db[ROLLUP_COLLECTION].delete_many({})
+        await rebuild_rollup()
+    else:
+        touched = db["order"].aggregate([
+            {"$match": {"updated_at": {"$gte": state["last_run"] - RECONCILE_OVERLAP}}},
+            {"$group": {"_id": DAY_EXPR}},
+        ])
+        days = [d["_id"] async for d in touched if d["_id"] is not None]
+        if days:
+            await rebuild_rollup({"$or": [
+                {"created_at": {"$gte": day, "$lt": day_key(local_day(day) + timedelta(days=1))}}
+                for day in days
+            ]})
+    await db[STATE_COLLECTION].update_one(
+        {"_id": ROLLUP_COLLECTION}, {"$set": {"last_run": started, "timezone": REPORT_TIMEZONE}}, upsert=True
+    )
+
+async def ensure_rollup():
+    """Create the rollup indexes and bring it up to date (full build on first run)"""
+    await db[ROLLUP_COLLECTION].create_index("day", unique=True)
+    # serve the reconcile's touched-orders scan and per-day recompute
+    await db["order"].create_index("updated_at")
+    await db["order"].create_index("created_at")
+    await reconcile_rollup()
+
+async def claim_lease() -> bool:
+    """Take or renew the reconcile lease; False while another worker holds it"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db[STATE_COLLECTION].update_one(
+            {"_id": LEASE_ID, "$or": [{"owner": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + LEASE_TTL}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # the lease exists and is held by someone else, so the upsert collided
+        return False
+    return True
+
+async def reconcile_forever(interval: int = RECONCILE_INTERVAL):
+    """Run ensure_rollup now and then every `interval` seconds on the worker holding
+    the lease; failures are logged and retried"""
+    while True:
+        try:
+            if await claim_lease():
+                await ensure_rollup()
+        except Exception:
+            logger.exception("Order rollup reconcile failed")
+        await asyncio.sleep(interval)
+
+async def read_rollup(day_from: Optional[date] = None, day_to: Optional[date] = None) -> dict:
+    """Sum the rollup over an inclusive range of REPORT_TIMEZONE calendar days"""
+    day = {}
+    if day_from:
+        day["$gte"] = day_key(day_from)
+    if day_to:
+        day["$lte"] = day_key(day_to)
+    revenue = 0.0
+    orders = 0
+    by_status = defaultdict(lambda: {"revenue": 0.0, "orders": 0})
+    async for d in db[ROLLUP_COLLECTION].find({"day": day} if day else {}):
+        revenue += d.get("revenue", 0)
+        orders += d.get("orders", 0)
+        for status, totals in (d.get("by_status") or {}).items():
+            by_status[status]["revenue"] += totals.get("revenue", 0)
+            by_status[status]["orders"] += totals.get("orders", 0)
+    return {
+        "revenue": round(float(revenue), 2),
+        "orders": int(orders),
+        "by_status": {
+            s: {"revenue": round(float(t["revenue"]), 2), "orders": int(t["orders"])}
+            for s, t in by_status.items()
+            if t["orders"]
+        },
+    }
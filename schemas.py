@@ -40,10 +40,12 @@ class Payment(BaseModel):
     amount: float = Field(0, ge=0)
     reference: Optional[str] = None
 
+OrderStatus = Literal["pending","preparing","ready","served","cancelled"]
+
 class Order(BaseModel):
     table_no: Optional[str] = Field(None, description="Table number or token")
     customer_id: Optional[str] = None
-    status: Literal["pending","preparing","ready","served","cancelled"] = "pending"
+    status: OrderStatus = "pending"
     items: List[OrderItem]
     subtotal: float = 0
     tax_total: float = 0